@@ -1,17 +1,23 @@
 import functions_framework
 import json
 import logging
+import orjson
+import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from html import unescape
-from bs4 import BeautifulSoup
 from google.cloud.logging import Client
 from firebase_admin import initialize_app, firestore
 
 # Initialize Firebase
 initialize_app()
 db = firestore.client()
+CALENDAR_DOC = db.collection("universityCalendar").document("events")
 
 # Set up Cloud Logging
 Client().setup_logging()
@@ -19,79 +25,125 @@ Client().setup_logging()
 LOCALIST_BASE_URL = "https://calendar.ncsu.edu/api/2/events"
 EASTERN = ZoneInfo("America/New_York")
 
+# Shared HTTP session — keep-alive across calls, retry transient failures
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, read=False, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
 
-def fetch_localist_events():
-    """Fetch events from the Localist calendar API (14 days, up to 2 pages)."""
-    url = f"{LOCALIST_BASE_URL}?days=14&pp=100"
-    response = requests.get(url, timeout=15)
+
+def fetch_localist_page(page):
+    """Fetch a single page of Localist events (14 days, 100 per page)."""
+    response = SESSION.get(f"{LOCALIST_BASE_URL}?days=14&pp=100&page={page}", timeout=15)
     response.raise_for_status()
-    data = response.json()
+    return orjson.loads(response.content)
+
+
+def fetch_localist_events():
+    """
+    Fetch events from the Localist calendar API (14 days, up to 2 pages).
+
+    Page 2 is requested speculatively alongside page 1, but its result
+    (or error) is only used when page 1 reports page.total >= 2.
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first_future = executor.submit(fetch_localist_page, 1)
+        second_future = executor.submit(fetch_localist_page, 2)
 
-    if not isinstance(data, dict):
-        logging.error(f"Unexpected Localist response type: {type(data).__name__}")
-        return []
+        data = first_future.result()
+        if not isinstance(data, dict):
+            logging.error("Unexpected Localist response type: %s", type(data).__name__)
+            return []
 
-    events = data.get("events", [])
+        events = data.get("events", [])
 
-    # Fetch second page if it exists
-    total_pages = data.get("page", {}).get("total", 1)
-    if total_pages >= 2:
-        response2 = requests.get(f"{url}&page=2", timeout=15)
-        response2.raise_for_status()
-        events += response2.json().get("events", [])
+        total_pages = data.get("page", {}).get("total", 1)
+        if total_pages >= 2:
+            extra = second_future.result()
+            if isinstance(extra, dict):
+                events += extra.get("events", [])
 
     return events
 
 
+HTML_TAG_RE = re.compile(r"</?[A-Za-z][^>]*>")
+# Comments, doctypes and script/style blocks hold non-text content the regex can't drop
+NON_TEXT_MARKUP_RE = re.compile(r"<!|<(?:script|style)\b", re.IGNORECASE)
+SHORT_HTML_MAX_LEN = 200
+
+# Shared read-only default for missing nested objects — never mutated
+EMPTY = {}
+
+
 def clean_html(html_str):
     """Strip HTML tags and unescape entities to plain text."""
     if not html_str:
         return ""
-    return BeautifulSoup(unescape(html_str), "html.parser").get_text().strip()
 
+    # Plain text needs no parsing at all
+    if "<" not in html_str and "&" not in html_str:
+        return html_str.strip()
+
+    text = unescape(html_str)
+
+    # Short snippets of plain tags are cheaper to strip with a regex than to parse
+    if len(text) <= SHORT_HTML_MAX_LEN and not NON_TEXT_MARKUP_RE.search(text):
+        return HTML_TAG_RE.sub("", text).strip()
+
+    # Imported lazily so cold starts that never hit long HTML skip loading it
+    from selectolax.lexbor import LexborHTMLParser
+    tree = LexborHTMLParser(text)
+    tree.strip_tags(["script", "style"])
+    return tree.text().strip()
 
+
+# Recurring events share start/end timestamps, so conversions repeat a lot
+@lru_cache(maxsize=4096)
 def to_eastern(time_str):
     """Convert an ISO time string to Eastern time."""
     if not time_str:
         return None
+    if time_str.endswith("Z"):
+        time_str = time_str[:-1] + "+00:00"
     try:
-        dt = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
-        return dt.astimezone(EASTERN).isoformat()
+        return datetime.fromisoformat(time_str).astimezone(EASTERN).isoformat()
     except (ValueError, TypeError):
         return time_str
 
 
 def format_event(item):
     """Transform a Localist event into the unified schema. Returns None for non-live events."""
-    e = item.get("event", {})
+    e = item.get("event") or EMPTY
 
     # Skip non-live events
     if e.get("status") != "live":
         return None
 
-    geo = e.get("geo", {})
-
-    instance = {}
-    instances = e.get("event_instances", [])
-    if instances:
-        instance = instances[0].get("event_instance", {})
+    instances = e.get("event_instances")
+    instance = (instances[0].get("event_instance") or EMPTY) if instances else EMPTY
 
     event_id = e.get("id", "")
     instance_id = instance.get("id", "")
 
-    categories = [t.get("name", "") for t in e.get("filters", {}).get("event_types", [])]
-    topics = [t.get("name", "") for t in e.get("filters", {}).get("event_topic", [])]
-    audience = [a.get("name", "") for a in e.get("filters", {}).get("event_target_audience", [])]
+    filters = e.get("filters") or EMPTY
+    categories = [t.get("name", "") for t in filters.get("event_types", ())]
+    topics = [t.get("name", "") for t in filters.get("event_topic", ())]
+    audience = [a.get("name", "") for a in filters.get("event_target_audience", ())]
 
-    departments = e.get("departments", [])
+    departments = e.get("departments")
     department = departments[0].get("name") if departments else None
 
-    try:
-        lat = float(geo["latitude"]) if geo.get("latitude") else None
-        lng = float(geo["longitude"]) if geo.get("longitude") else None
-    except (ValueError, TypeError):
-        lat, lng = None, None
-    coordinate = {"lat": lat, "lng": lng} if lat and lng else None
+    coordinate = None
+    geo = e.get("geo")
+    if geo and geo.get("latitude") and geo.get("longitude"):
+        try:
+            lat, lng = float(geo["latitude"]), float(geo["longitude"])
+        except (ValueError, TypeError):
+            lat, lng = None, None
+        if lat and lng:
+            coordinate = {"lat": lat, "lng": lng}
 
     return {
         "id": f"localist_{event_id}_{instance_id}",
@@ -120,37 +172,94 @@ def format_event(item):
     }
 
 
+BULK_WRITE_MAX_ATTEMPTS = 5
+
+
+def _compact(value):
+    """Recursively drop None values and empty dicts/lists so they aren't stored in Firestore."""
+    if isinstance(value, dict):
+        items = ((k, _compact(v)) for k, v in value.items())
+        return {k: v for k, v in items if v is not None and v != {} and v != []}
+    if isinstance(value, list):
+        items = (_compact(v) for v in value)
+        return [v for v in items if v is not None and v != {} and v != []]
+    return value
+
+
+def save_events(doc_ref, events_dict, today_count, last_updated):
+    """
+    Write each event as its own document under doc_ref/items via BulkWriter,
+    deleting any event documents that are no longer in events_dict.
+    The parent document only keeps summary fields, and is not written if
+    any event write fails (the RuntimeError surfaces as a 500).
+    """
+    items_ref = doc_ref.collection("items")
+    stale_ids = {d.id for d in items_ref.list_documents()} - set(events_dict)
+
+    # BulkWriter drops a write once its error callback stops retrying, and
+    # close() doesn't raise — collect those failures ourselves
+    failures = []
+
+    def on_write_error(error, _bulk_writer):
+        if error.attempts < BULK_WRITE_MAX_ATTEMPTS:
+            return True
+        failures.append(error)
+        return False
+
+    bw = db.bulk_writer()
+    bw.on_write_error(on_write_error)
+    for event_id, event in events_dict.items():
+        bw.set(items_ref.document(event_id), _compact(event))
+    for event_id in stale_ids:
+        bw.delete(items_ref.document(event_id))
+    bw.close()
+
+    if failures:
+        for failure in failures[:10]:
+            logging.error("Failed to write %s: %s (code %s)", failure.operation.reference.path, failure.message, failure.code)
+        raise RuntimeError(f"{len(failures)} event writes to {items_ref.path} failed")
+
+    doc_ref.set({
+        "todayCount": today_count,
+        "total": len(events_dict),
+        "lastUpdated": last_updated,
+    })
+
+    if stale_ids:
+        logging.info("Removed %s obsolete events from %s/items", len(stale_ids), doc_ref.path)
+
+
 @functions_framework.http
 def get_calendar_events(request):
     try:
+        now = datetime.now(EASTERN)
         raw_events = fetch_localist_events()
-        events = [format_event(item) for item in raw_events]
-        events = [e for e in events if e is not None]
-        logging.info(f"Fetched {len(events)} live Localist events")
+        today_str = now.date().isoformat()
 
-        if not events:
-            logging.warning("No live Localist events found.")
-            return (json.dumps({"status": "ok", "count": 0, "message": "No live events found"}), 200, {"Content-Type": "application/json"})
+        # Format, key and count today's events in a single pass
+        events_dict = {}
+        today_count = 0
+        for item in raw_events:
+            event = format_event(item)
+            if event is None:
+                continue
+            events_dict[event["id"]] = event
+            start = event.get("start")
+            if start and start.startswith(today_str):
+                today_count += 1
 
-        today_str = datetime.now(EASTERN).date().isoformat()
-        today_count = sum(
-            1 for e in events
-            if e.get("start") and e["start"].startswith(today_str)
-        )
+        logging.info("Fetched %s live Localist events", len(events_dict))
 
-        events_dict = {e["id"]: e for e in events}
+        if not events_dict:
+            logging.warning("No live Localist events found.")
+            return (json.dumps({"status": "ok", "count": 0, "message": "No live events found"}), 200, {"Content-Type": "application/json"})
 
-        timestamp = datetime.now(EASTERN).strftime("%Y-%m-%d %I:%M:%S %p")
-        doc_ref = db.collection("universityCalendar").document("events")
-        doc_ref.set({
-            "items": events_dict,
-            "todayCount": today_count,
-            "lastUpdated": timestamp,
-        })
+        timestamp = now.strftime("%Y-%m-%d %I:%M:%S %p")
+        save_events(CALENDAR_DOC, events_dict, today_count, timestamp)
 
-        logging.info(f"Calendar events updated: {len(events)} total, {today_count} today")
-        return (json.dumps({"status": "ok", "count": len(events), "todayCount": today_count}), 200, {"Content-Type": "application/json"})
+        logging.info("Calendar events updated: %s total, %s today", len(events_dict), today_count)
+        return (json.dumps({"status": "ok", "count": len(events_dict), "todayCount": today_count}), 200, {"Content-Type": "application/json"})
 
     except Exception as e:
-        logging.error(f"Unhandled error in get_calendar_events: {e}")
+        logging.error("Unhandled error in get_calendar_events: %s", e)
         return (json.dumps({"status": "error", "message": str(e)}), 500, {"Content-Type": "application/json"})
\ No newline at end of file
@@ -3,6 +3,8 @@ import json
 import logging
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import polyline
 from datetime import datetime
 from zoneinfo import ZoneInfo
@@ -18,6 +20,14 @@ Client().setup_logging()
 
 EASTERN = ZoneInfo("America/New_York")
 
+# Shared HTTP session — keep-alive across calls, retry transient failures
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, read=False, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
 # GIS API URLs
 BUILDINGS_URL = "https://gismaps.oit.ncsu.edu/arcgis/rest/services/Buildings/Buildings_OnlineCampusMap/MapServer/1/query?where=CITY%3D'Raleigh'&outFields=BLDG_NUM,BLDG_NAME,BLDG_ABBR,ADDRESS,CITY,STATE,ZIP,LATITUDE,LONGITUDE,MAPNAME&returnGeometry=false&returnTrueCurves=false&returnDistinctValues=true&f=pjson"
 
@@ -32,7 +42,7 @@ PATHS_BASE_URL = "https://gismaps.oit.ncsu.edu/arcgis/rest/services/Accessibilit
 
 def fetch_json(url):
     """Fetch JSON from a URL with timeout and error handling."""
-    response = requests.get(url, timeout=15)
+    response = SESSION.get(url, timeout=15)
     response.raise_for_status()
     return response.json()
 
@@ -1,8 +1,11 @@
 import functions_framework
 import json
 import logging
+import orjson
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from google.cloud.logging import Client
@@ -10,6 +13,7 @@ from firebase_admin import initialize_app, db as firebase_db
 
 # Initialize Firebase
 initialize_app(options={'databaseURL': 'https://ot-campus-app-default-rtdb.firebaseio.com/'})
+BUSYNESS_REF = firebase_db.reference("liveCampusBusyness")
 
 # Set up Cloud Logging
 Client().setup_logging()
@@ -17,12 +21,20 @@ Client().setup_logging()
 WAITZ_URL = "https://waitz.io/live/ncsu"
 EASTERN = ZoneInfo("America/New_York")
 
+# Shared HTTP session — keep-alive across calls, retry transient failures
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, read=False, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
 
 def fetch_waitz_data():
     """Fetch busyness data from the Waitz API."""
-    response = requests.get(WAITZ_URL, timeout=10)
+    response = SESSION.get(WAITZ_URL, timeout=10)
     response.raise_for_status()
-    return response.json()
+    return orjson.loads(response.content)
 
 
 def occupancy_status(occupancy):
@@ -83,7 +95,7 @@ def get_live_campus_busyness(request):
         # --- Fetch ---
         start = time.time()
         data = fetch_waitz_data()
-        logging.info(f"Waitz API: {time.time() - start:.2f}s — type: {type(data).__name__}")
+        logging.info("Waitz API: %.2fs — type: %s", time.time() - start, type(data).__name__)
 
         # --- Parse ---
         start = time.time()
@@ -92,7 +104,7 @@ def get_live_campus_busyness(request):
         elif isinstance(data, list):
             locations = data
         else:
-            logging.error(f"Unexpected response format: {json.dumps(data)[:500]}")
+            logging.error("Unexpected response format: %s", json.dumps(data)[:500])
             return (json.dumps({"status": "error", "message": "Unexpected response format"}), 500, {"Content-Type": "application/json"})
 
         if not locations:
@@ -103,35 +115,32 @@ def get_live_campus_busyness(request):
         for location in locations:
             loc_id = location.get("id")
             if not loc_id:
-                logging.warning(f"Skipping location with no id: {location.get('name')}")
+                logging.warning("Skipping location with no id: %s", location.get('name'))
                 continue
             location_updates[str(loc_id)] = build_location(location)
 
-        logging.info(f"Parse: {time.time() - start:.2f}s — {len(location_updates)} locations")
-
-        # --- Write locations ---
-        start = time.time()
-        ref = firebase_db.reference("liveCampusBusyness")
-        ref.child("locations").set(location_updates)
-        logging.info(f"Firebase write locations: {time.time() - start:.2f}s")
+        logging.info("Parse: %.2fs — %s locations", time.time() - start, len(location_updates))
 
-        # --- Write lastUpdated ---
+        # --- Write locations + lastUpdated in one round-trip ---
         start = time.time()
         last_updated = datetime.now(EASTERN).strftime("%Y-%m-%d %I:%M:%S %p")
-        ref.child("lastUpdated").set(last_updated)
-        logging.info(f"Firebase write lastUpdated: {time.time() - start:.2f}s")
+        BUSYNESS_REF.update({
+            "locations": location_updates,
+            "lastUpdated": last_updated,
+        })
+        logging.info("Firebase write: %.2fs", time.time() - start)
 
-        logging.info(f"Total: {time.time() - start_total:.2f}s — {len(location_updates)} locations updated")
+        logging.info("Total: %.2fs — %s locations updated", time.time() - start_total, len(location_updates))
         return (json.dumps({"status": "ok", "locations": len(location_updates)}), 200, {"Content-Type": "application/json"})
 
     except requests.exceptions.Timeout:
-        logging.error(f"Waitz API timed out after {time.time() - start_total:.2f}s")
+        logging.error("Waitz API timed out after %.2fs", time.time() - start_total)
         return (json.dumps({"status": "error", "message": "Waitz API timeout"}), 500, {"Content-Type": "application/json"})
 
     except requests.exceptions.RequestException as e:
-        logging.error(f"Waitz API request failed after {time.time() - start_total:.2f}s: {e}")
+        logging.error("Waitz API request failed after %.2fs: %s", time.time() - start_total, e)
         return (json.dumps({"status": "error", "message": str(e)}), 500, {"Content-Type": "application/json"})
 
     except Exception as e:
-        logging.error(f"Unhandled error after {time.time() - start_total:.2f}s: {e}")
+        logging.error("Unhandled error after %.2fs: %s", time.time() - start_total, e)
         return (json.dumps({"status": "error", "message": str(e)}), 500, {"Content-Type": "application/json"})
\ No newline at end of file
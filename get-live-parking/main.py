@@ -1,7 +1,11 @@
 import functions_framework
 import json
 import logging
+import orjson
+import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 from datetime import datetime
 from zoneinfo import ZoneInfo
@@ -10,6 +14,7 @@ from firebase_admin import initialize_app, db as firebase_db
 
 # Initialize Firebase
 initialize_app(options={'databaseURL': 'https://ot-campus-app-default-rtdb.firebaseio.com/'})
+PARKING_REF = firebase_db.reference("liveParking")
 
 # Set up Cloud Logging
 Client().setup_logging()
@@ -17,28 +22,33 @@ Client().setup_logging()
 OPENSPACE_URL = "https://api.streetsoncloud.com/pl2/multi-lot-info"
 EASTERN = ZoneInfo("America/New_York")
 
+# Shared HTTP session — keep-alive across calls, retry transient failures
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, read=False, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+SESSION.headers.update({
+    "Content-Type": "application/json",
+    "x-api-key": os.getenv("OPENSPACE_API_KEY", ""),
+})
+
 
 def fetch_parking_data():
     """Fetch parking data from the OpenSpace API."""
-    response = requests.get(
-        OPENSPACE_URL,
-        headers={
-            "Content-Type": "application/json",
-            "x-api-key": os.getenv("OPENSPACE_API_KEY", ""),
-        },
-        timeout=10,
-    )
+    response = SESSION.get(OPENSPACE_URL, timeout=10)
     response.raise_for_status()
-    return response.json()
+    return orjson.loads(response.content)
+
+
+GEOCODE_RE = re.compile(r"\(?\s*([-+]?(?:\d+(?:\.\d*)?|\.\d+))\s*,\s*([-+]?(?:\d+(?:\.\d*)?|\.\d+))\s*\)?")
 
 
 def parse_coordinate(geocode_str):
     """Parse a '(lat, lng)' string into a coordinate dict."""
-    try:
-        lat_str, lng_str = geocode_str.strip("()").split(",")
-        return {"lat": float(lat_str), "lng": float(lng_str)}
-    except (ValueError, AttributeError):
-        return None
+    m = GEOCODE_RE.fullmatch(geocode_str.strip()) if isinstance(geocode_str, str) else None
+    return {"lat": float(m.group(1)), "lng": float(m.group(2))} if m else None
 
 
 def parse_int(value, default=0):
@@ -55,8 +65,8 @@ def lot_key_from_name(name):
     return words[0].lower() + "".join(w.capitalize() for w in words[1:])
 
 
-def build_lot_data(lot, current_data, key):
-    """Build the update dict for a single parking lot."""
+def build_lot_data(lot, hidden, key):
+    """Build the update dict for a single parking lot. `hidden` is the sparse liveParking/hidden map."""
     return {
         "id": key,
         "name": lot.get("location_name", ""),
@@ -65,50 +75,76 @@ def build_lot_data(lot, current_data, key):
         "totalSpaces": parse_int(lot.get("total_spaces")),
         "availableSpaces": parse_int(lot.get("free_spaces")),
         "occupancy": parse_int(lot.get("occupancy")),
-        "isHidden": current_data.get("isHidden", False),
+        "isHidden": bool(hidden.get(key)),
     }
 
 
+def hidden_from_legacy_lots():
+    """
+    One-off migration: build the hidden map from the legacy lots/*/isHidden
+    flags. The caller persists it along with liveParking/hiddenSeeded.
+    """
+    current_lots = PARKING_REF.child("lots").get() or {}
+    if not isinstance(current_lots, dict):
+        return {}
+    hidden = {key: True for key, lot in current_lots.items() if isinstance(lot, dict) and lot.get("isHidden")}
+    logging.info("Seeding liveParking/hidden with %s lots from existing isHidden flags", len(hidden))
+    return hidden
+
+
 @functions_framework.http
 def get_live_parking(request):
     try:
         response = fetch_parking_data()
-        logging.info(f"OpenSpace response type: {type(response).__name__}")
+        logging.info("OpenSpace response type: %s", type(response).__name__)
 
         # The API returns a nested list — the actual lots are in the first element
         if isinstance(response, list) and len(response) > 0:
             parking_lots = response[0] if isinstance(response[0], list) else response
         else:
-            logging.error(f"Unexpected response format: {json.dumps(response)[:500]}")
+            logging.error("Unexpected response format: %s", json.dumps(response)[:500])
             return (json.dumps({"status": "error", "message": "Unexpected response format"}), 500, {"Content-Type": "application/json"})
 
         if not parking_lots:
             logging.info("No parking lots returned from API.")
             return (json.dumps({"status": "ok", "message": "No parking lots returned"}), 200, {"Content-Type": "application/json"})
 
-        ref = firebase_db.reference("liveParking")
-        current_lots = ref.child("lots").get() or {}
+        # Only hidden lots are listed here ({key: true}), so this read stays small
+        hidden = PARKING_REF.child("hidden").get()
+
+        # The map is absent whenever no lot is hidden (RTDB drops empty maps), so
+        # hiddenSeeded records that the one-off migration from lots has run
+        seed_updates = {}
+        if hidden is None and not PARKING_REF.child("hiddenSeeded").get():
+            hidden = hidden_from_legacy_lots()
+            seed_updates = {"hidden": hidden, "hiddenSeeded": True}
+
+        if not isinstance(hidden, dict):
+            if hidden is not None:
+                logging.warning("Ignoring non-map liveParking/hidden value: %s", hidden)
+            hidden = {}
 
         # Build all lot data in one pass
         updated_lots = {}
         for lot in parking_lots:
             name = lot.get("location_name")
             if not name:
-                logging.warning(f"Skipping lot with no name: {lot}")
+                logging.warning("Skipping lot with no name: %s", lot)
                 continue
 
             key = lot_key_from_name(name)
-            current_data = current_lots.get(key, {})
-            updated_lots[key] = build_lot_data(lot, current_data, key)
+            updated_lots[key] = build_lot_data(lot, hidden, key)
 
-        # Single atomic write replaces all lots and removes obsolete ones
+        # Single atomic write replaces all lots and removes obsolete ones,
+        # leaving the hidden map untouched (except on the one-off seed run)
         last_updated = datetime.now(EASTERN).strftime("%Y-%m-%d %I:%M:%S %p")
-        ref.set({
+        PARKING_REF.update({
             "lots": updated_lots,
             "lastUpdated": last_updated,
+            **seed_updates,
         })
 
-        logging.info(f"Parking updated: {len(updated_lots)} lots")
+        logging.info("Parking updated: %s lots", len(updated_lots))
         return (json.dumps({"status": "ok", "lots": len(updated_lots)}), 200, {"Content-Type": "application/json"})
 
     except requests.exceptions.Timeout:
@@ -116,9 +152,9 @@ def get_live_parking(request):
         return (json.dumps({"status": "error", "message": "OpenSpace API timeout"}), 500, {"Content-Type": "application/json"})
 
     except requests.exceptions.RequestException as e:
-        logging.error(f"OpenSpace API request failed: {e}")
+        logging.error("OpenSpace API request failed: %s", e)
         return (json.dumps({"status": "error", "message": str(e)}), 500, {"Content-Type": "application/json"})
 
     except Exception as e:
-        logging.error(f"Unhandled error in get_live_parking: {e}")
+        logging.error("Unhandled error in get_live_parking: %s", e)
         return (json.dumps({"status": "error", "message": str(e)}), 500, {"Content-Type": "application/json"})
\ No newline at end of file
@@ -1,18 +1,25 @@
 import functions_framework
 import json
 import logging
+import orjson
+import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from html import unescape
-from bs4 import BeautifulSoup
 from google.cloud.logging import Client
 from firebase_admin import initialize_app, firestore
 
 # Initialize Firebase
 initialize_app()
 db = firestore.client()
+ORGANIZATIONS_DOC = db.collection("getInvolved").document("organizations")
+ORG_EVENTS_DOC = db.collection("getInvolved").document("events")
 
 # Set up Cloud Logging
 Client().setup_logging()
@@ -28,6 +35,16 @@ def get_engage_headers():
     return {"X-Engage-Api-Key": os.getenv("ENGAGE_API_KEY", "")}
 
 
+# Shared HTTP session — keep-alive across calls, retry transient failures
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, read=False, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+SESSION.headers.update(get_engage_headers())
+
+
 # ── Events ───────────────────────────────────────────────────────────
 
 
@@ -56,17 +73,16 @@ def fetch_engage_events():
             "skip": skip,
         }
 
-        resp = requests.get(
+        resp = SESSION.get(
             ENGAGE_EVENTS_URL,
-            headers=get_engage_headers(),
             params=params,
             timeout=15,
         )
         resp.raise_for_status()
-        data = resp.json()
+        data = orjson.loads(resp.content)
 
         if isinstance(data, dict) and "error" in data:
-            logging.error(f"Engage API error: {data['error']}")
+            logging.error("Engage API error: %s", data['error'])
             return []
 
         items = (data or {}).get("items", []) or []
@@ -105,20 +121,19 @@ def fetch_all_organizations():
         params = {"take": take, "skip": skip}
 
         try:
-            resp = requests.get(
+            resp = SESSION.get(
                 ENGAGE_ORGS_URL,
-                headers=get_engage_headers(),
                 params=params,
                 timeout=15,
             )
             resp.raise_for_status()
-            data = resp.json()
+            data = orjson.loads(resp.content)
         except Exception as e:
-            logging.warning(f"Failed fetching orgs page {page}: {e}")
+            logging.warning("Failed fetching orgs page %s: %s", page, e)
             break
 
         if isinstance(data, dict) and "error" in data:
-            logging.error(f"Engage Orgs API error: {data['error']}")
+            logging.error("Engage Orgs API error: %s", data['error'])
             break
 
         items = (data or {}).get("items", []) or []
@@ -147,17 +162,17 @@ def fetch_organization_names_by_ids(org_ids):
     url = f"{ENGAGE_ORGS_URL}?{ids_params}&take=500"
 
     try:
-        resp = requests.get(url, headers=get_engage_headers(), timeout=15)
+        resp = SESSION.get(url, timeout=15)
         resp.raise_for_status()
-        data = resp.json()
+        data = orjson.loads(resp.content)
 
         if isinstance(data, dict) and "error" in data:
-            logging.error(f"Engage Orgs API error: {data['error']}")
+            logging.error("Engage Orgs API error: %s", data['error'])
             return {}
 
         return {item["id"]: item.get("name", "") for item in (data or {}).get("items", []) or []}
     except Exception as e:
-        logging.warning(f"Failed to fetch organization names: {e}")
+        logging.warning("Failed to fetch organization names: %s", e)
         return {}
 
 
@@ -189,20 +204,44 @@ def format_organization(item):
 # ── Shared helpers ───────────────────────────────────────────────────
 
 
+HTML_TAG_RE = re.compile(r"</?[A-Za-z][^>]*>")
+# Comments, doctypes and script/style blocks hold non-text content the regex can't drop
+NON_TEXT_MARKUP_RE = re.compile(r"<!|<(?:script|style)\b", re.IGNORECASE)
+SHORT_HTML_MAX_LEN = 200
+
+
 def clean_html(html_str):
     """Strip HTML tags and unescape entities to plain text."""
     if not html_str:
         return ""
-    return BeautifulSoup(unescape(html_str), "html.parser").get_text().strip()
 
+    # Plain text needs no parsing at all
+    if "<" not in html_str and "&" not in html_str:
+        return html_str.strip()
+
+    text = unescape(html_str)
 
+    # Short snippets of plain tags are cheaper to strip with a regex than to parse
+    if len(text) <= SHORT_HTML_MAX_LEN and not NON_TEXT_MARKUP_RE.search(text):
+        return HTML_TAG_RE.sub("", text).strip()
+
+    # Imported lazily so cold starts that never hit long HTML skip loading it
+    from selectolax.lexbor import LexborHTMLParser
+    tree = LexborHTMLParser(text)
+    tree.strip_tags(["script", "style"])
+    return tree.text().strip()
+
+
+# Recurring events share start/end timestamps, so conversions repeat a lot
+@lru_cache(maxsize=4096)
 def to_eastern(time_str):
     """Convert an ISO time string to Eastern time (ISO string)."""
     if not time_str:
         return None
+    if time_str.endswith("Z"):
+        time_str = time_str[:-1] + "+00:00"
     try:
-        dt = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
-        return dt.astimezone(EASTERN).isoformat()
+        return datetime.fromisoformat(time_str).astimezone(EASTERN).isoformat()
     except (ValueError, TypeError):
         return time_str
 
@@ -366,52 +405,116 @@ def format_event(item, org_map):
     }
 
 
-# ── Entry point ──────────────────────────────────────────────────────
+# ── Firestore ────────────────────────────────────────────────────────
 
 
-@functions_framework.http
-def get_organization_events(request):
-    try:
-        last_updated = datetime.now(EASTERN).strftime("%Y-%m-%d %I:%M:%S %p")
+BULK_WRITE_MAX_ATTEMPTS = 5
 
-        # ── 1. Fetch & save organizations ────────────────────────────
-        raw_orgs = fetch_all_organizations()
-        logging.info(f"Fetched {len(raw_orgs)} total organizations from Engage")
 
-        active_orgs = [o for o in raw_orgs if (o.get("status") or "").strip().lower() == "active"]
-        logging.info(f"Filtered to {len(active_orgs)} active organizations")
+def _compact(value):
+    """Recursively drop None values and empty dicts/lists so they aren't stored in Firestore."""
+    if isinstance(value, dict):
+        items = ((k, _compact(v)) for k, v in value.items())
+        return {k: v for k, v in items if v is not None and v != {} and v != []}
+    if isinstance(value, list):
+        items = (_compact(v) for v in value)
+        return [v for v in items if v is not None and v != {} and v != []]
+    return value
 
-        EXCLUDED_ORG_TYPES = {"test organization type", "branch"}
-        active_orgs = [
-            o for o in active_orgs
-            if ((o.get("organizationType") or {}).get("name") or "").strip().lower() not in EXCLUDED_ORG_TYPES
-        ]
-        logging.info(f"After excluding org types: {len(active_orgs)} organizations")
 
-        formatted_orgs = [format_organization(o) for o in active_orgs]
-        orgs_dict = {str(o["id"]): o for o in formatted_orgs if o.get("id")}
+def save_events(doc_ref, events_dict, today_count, last_updated):
+    """
+    Write each event as its own document under doc_ref/items via BulkWriter,
+    deleting any event documents that are no longer in events_dict.
+    The parent document only keeps summary fields, and is not written if
+    any event write fails (the RuntimeError surfaces as a 500).
+    """
+    items_ref = doc_ref.collection("items")
+    stale_ids = {d.id for d in items_ref.list_documents()} - set(events_dict)
+
+    # BulkWriter drops a write once its error callback stops retrying, and
+    # close() doesn't raise — collect those failures ourselves
+    failures = []
+
+    def on_write_error(error, _bulk_writer):
+        if error.attempts < BULK_WRITE_MAX_ATTEMPTS:
+            return True
+        failures.append(error)
+        return False
+
+    bw = db.bulk_writer()
+    bw.on_write_error(on_write_error)
+    for event_id, event in events_dict.items():
+        bw.set(items_ref.document(event_id), _compact(event))
+    for event_id in stale_ids:
+        bw.delete(items_ref.document(event_id))
+    bw.close()
+
+    if failures:
+        for failure in failures[:10]:
+            logging.error("Failed to write %s: %s (code %s)", failure.operation.reference.path, failure.message, failure.code)
+        raise RuntimeError(f"{len(failures)} event writes to {items_ref.path} failed")
+
+    doc_ref.set({
+        "todayCount": today_count,
+        "total": len(events_dict),
+        "lastUpdated": last_updated,
+    })
+
+    if stale_ids:
+        logging.info("Removed %s obsolete events from %s/items", len(stale_ids), doc_ref.path)
 
-        db.collection("getInvolved").document("organizations").set({
-            "items": orgs_dict,
-            "totalCount": len(orgs_dict),
-            "lastUpdated": last_updated,
-        })
-        logging.info(f"Saved {len(orgs_dict)} organizations to getInvolved/organizations")
 
-        # ── 2. Fetch & save events ───────────────────────────────────
-        raw_events = fetch_engage_events()
-        logging.info(f"Fetched {len(raw_events)} Engage events (raw)")
+# ── Entry point ──────────────────────────────────────────────────────
 
-        public_raw_events = [e for e in raw_events if is_public_event(e)]
-        logging.info(f"Filtered to {len(public_raw_events)} public Engage events")
 
-        if not public_raw_events:
-            db.collection("getInvolved").document("events").set({
-                "items": {},
-                "todayCount": 0,
+@functions_framework.http
+def get_organization_events(request):
+    try:
+        now = datetime.now(EASTERN)
+        last_updated = now.strftime("%Y-%m-%d %I:%M:%S %p")
+
+        # Events don't depend on the org list — page through them on a
+        # background thread while organizations are fetched here. The
+        # with-block joins that thread even if the org steps raise.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            events_future = executor.submit(fetch_engage_events)
+
+            # ── 1. Fetch & save organizations ────────────────────────
+            raw_orgs = fetch_all_organizations()
+            logging.info("Fetched %s total organizations from Engage", len(raw_orgs))
+
+            active_orgs = [o for o in raw_orgs if (o.get("status") or "").strip().lower() == "active"]
+            logging.info("Filtered to %s active organizations", len(active_orgs))
+
+            EXCLUDED_ORG_TYPES = {"test organization type", "branch"}
+            active_orgs = [
+                o for o in active_orgs
+                if ((o.get("organizationType") or {}).get("name") or "").strip().lower() not in EXCLUDED_ORG_TYPES
+            ]
+            logging.info("After excluding org types: %s organizations", len(active_orgs))
+
+            formatted_orgs = [format_organization(o) for o in active_orgs]
+            orgs_dict = {str(o["id"]): o for o in formatted_orgs if o.get("id")}
+
+            ORGANIZATIONS_DOC.set({
+                "items": orgs_dict,
+                "totalCount": len(orgs_dict),
                 "lastUpdated": last_updated,
             })
-            logging.warning("No public Engage events found; wrote empty items to Firestore.")
+            logging.info("Saved %s organizations to getInvolved/organizations", len(orgs_dict))
+
+            # ── 2. Fetch & save events ───────────────────────────────
+            raw_events = events_future.result()
+
+        logging.info("Fetched %s Engage events (raw)", len(raw_events))
+
+        public_raw_events = [e for e in raw_events if is_public_event(e)]
+        logging.info("Filtered to %s public Engage events", len(public_raw_events))
+
+        if not public_raw_events:
+            save_events(ORG_EVENTS_DOC, {}, 0, last_updated)
+            logging.warning("No public Engage events found; cleared event items in Firestore.")
             return (json.dumps({"status": "ok", "organizations": len(orgs_dict), "events": 0}), 200, {"Content-Type": "application/json"})
 
         # Collect org IDs referenced by events for hosting name resolution
@@ -432,32 +535,29 @@ def get_organization_events(request):
             extra = fetch_organization_names_by_ids(missing_ids)
             org_name_map.update(extra)
 
-        logging.info(f"Resolved {len(org_name_map)} organization names for events")
-
-        events = [format_event(item, org_name_map) for item in public_raw_events]
-
-        today_str = datetime.now(EASTERN).date().isoformat()
-        today_count = sum(
-            1 for e in events
-            if e.get("start") and str(e["start"]).startswith(today_str)
-        )
+        logging.info("Resolved %s organization names for events", len(org_name_map))
 
-        events_dict = {str(e["id"]): e for e in events}
+        # Format, key and count today's events in a single pass
+        today_str = now.date().isoformat()
+        events_dict = {}
+        today_count = 0
+        for item in public_raw_events:
+            event = format_event(item, org_name_map)
+            events_dict[str(event["id"])] = event
+            start = event.get("start")
+            if start and str(start).startswith(today_str):
+                today_count += 1
 
-        db.collection("getInvolved").document("events").set({
-            "items": events_dict,
-            "todayCount": today_count,
-            "lastUpdated": last_updated,
-        })
+        save_events(ORG_EVENTS_DOC, events_dict, today_count, last_updated)
 
-        logging.info(f"Events updated: {len(events)} public total, {today_count} today")
+        logging.info("Events updated: %s public total, %s today", len(events_dict), today_count)
         return (json.dumps({
             "status": "ok",
             "organizations": len(orgs_dict),
-            "events": len(events),
+            "events": len(events_dict),
             "todayCount": today_count,
         }), 200, {"Content-Type": "application/json"})
 
     except Exception as e:
-        logging.exception(f"Unhandled error in get_organization_events: {e}")
+        logging.exception("Unhandled error in get_organization_events: %s", e)
         return (json.dumps({"status": "error", "message": str(e)}), 500, {"Content-Type": "application/json"})
\ No newline at end of file
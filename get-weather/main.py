@@ -1,17 +1,19 @@
 import functions_framework
 import json
 import logging
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from google.cloud.logging import Client
 from firebase_admin import initialize_app, db as firebase_db
-from astral import LocationInfo
-from astral.sun import sun
 
 # Initialize Firebase
 initialize_app(options={'databaseURL': 'https://ot-campus-app-default-rtdb.firebaseio.com/'})
+WEATHER_REF = firebase_db.reference("weather")
 
 # Set up Cloud Logging
 Client().setup_logging()
@@ -21,6 +23,15 @@ NCSTATE_LAT = 35.7717255492
 NCSTATE_LON = -78.6736536026
 EASTERN = ZoneInfo("America/New_York")
 
+# Shared HTTP session — keep-alive across calls, retry transient failures
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, read=False, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+SESSION.headers.update({"Content-Type": "application/json", "Accept": "application/json"})
+
 
 def fetch_weatherstem_data():
     """Fetch weather data from the WeatherStem API."""
@@ -28,14 +39,13 @@ def fetch_weatherstem_data():
         "api_key": os.getenv("WEATHERSTEM_API_KEY", ""),
         "stations": ["ncstate@wake.weatherstem.com"],
     }
-    response = requests.post(
+    response = SESSION.post(
         WEATHERSTEM_URL,
-        headers={"Content-Type": "application/json", "Accept": "application/json"},
-        data=json.dumps(payload),
+        data=orjson.dumps(payload),
         timeout=10,
     )
     response.raise_for_status()
-    return response.json()
+    return orjson.loads(response.content)
 
 
 def extract_readings(station):
@@ -68,26 +78,46 @@ def safe_int(value, default=0):
         return default
 
 
+WIND_DIRECTIONS = ("N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
+                   "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW")
+
+
 def wind_direction_label(degrees):
     """Convert wind degrees to a cardinal/intercardinal direction."""
-    directions = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
-                   "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
     try:
-        index = round(float(degrees) / 22.5) % 16
-        return directions[index]
+        return WIND_DIRECTIONS[int(float(degrees) % 360 * 16 / 360 + 0.5) & 15]
     except (ValueError, TypeError):
         return "N"
 
 
-def get_sunrise_sunset():
-    """Calculate sunrise/sunset for NC State's location today."""
+# Sunrise/sunset only changes daily — warm instances reuse it across invocations
+SUN_CACHE = {}
+SUN_CACHE_MAX_DAYS = 8
+
+
+def get_sunrise_sunset(now):
+    """Calculate sunrise/sunset for NC State's location on the given day (cached per date)."""
+    today = now.date()
+    cached = SUN_CACHE.get(today)
+    if cached:
+        return cached
+
+    # Imported lazily — only needed on the first invocation of each day
+    from astral import LocationInfo
+    from astral.sun import sun
+
     location = LocationInfo(latitude=NCSTATE_LAT, longitude=NCSTATE_LON)
-    s = sun(location.observer, date=datetime.now(EASTERN).date(), tzinfo=EASTERN)
-    return (
+    s = sun(location.observer, date=today, tzinfo=EASTERN)
+    result = (
         int(s["sunrise"].timestamp()),
         int(s["sunset"].timestamp()),
     )
 
+    if len(SUN_CACHE) >= SUN_CACHE_MAX_DAYS:
+        SUN_CACHE.clear()
+    SUN_CACHE[today] = result
+    return result
+
 
 def determine_feels_like(temperature, wind_chill, heat_index, wind_speed, humidity):
     """Return the appropriate 'feels like' value based on NWS standards."""
@@ -102,8 +132,9 @@ def determine_feels_like(temperature, wind_chill, heat_index, wind_speed, humidi
 @functions_framework.http
 def get_weather(request):
     try:
+        now = datetime.now(EASTERN)
         data = fetch_weatherstem_data()
-        logging.info(f"WeatherStem response type: {type(data).__name__}")
+        logging.info("WeatherStem response type: %s", type(data).__name__)
 
         # Safely extract the first station object
         if isinstance(data, list) and len(data) > 0:
@@ -111,7 +142,7 @@ def get_weather(request):
         elif isinstance(data, dict) and "record" in data:
             station = data
         else:
-            logging.error(f"Unexpected response format: {json.dumps(data)[:500]}")
+            logging.error("Unexpected response format: %s", json.dumps(data)[:500])
             return (json.dumps({"status": "error", "message": "Unexpected response format"}), 500, {"Content-Type": "application/json"})
 
         readings = extract_readings(station)
@@ -132,12 +163,12 @@ def get_weather(request):
         )
 
         try:
-            sunrise, sunset = get_sunrise_sunset()
+            sunrise, sunset = get_sunrise_sunset(now)
         except Exception as e:
-            logging.warning(f"Failed to calculate sunrise/sunset: {e}")
+            logging.warning("Failed to calculate sunrise/sunset: %s", e)
             sunrise, sunset = None, None
 
-        last_updated = datetime.now(EASTERN).strftime("%Y-%m-%d %I:%M:%S %p")
+        last_updated = now.strftime("%Y-%m-%d %I:%M:%S %p")
 
         weather_data = {
             "temperature": rounded_temp,
@@ -163,8 +194,8 @@ def get_weather(request):
         if image_url:
             weather_data["imageUrl"] = image_url
 
-        firebase_db.reference("weather").set(weather_data)
-        logging.info(f"Weather updated: {rounded_temp}°F, feels like {feels_like}°F")
+        WEATHER_REF.set(weather_data)
+        logging.info("Weather updated: %s°F, feels like %s°F", rounded_temp, feels_like)
         return (json.dumps({"status": "ok", "temperature": rounded_temp, "feelsLike": feels_like}), 200, {"Content-Type": "application/json"})
 
     except requests.exceptions.Timeout:
@@ -172,9 +203,9 @@ def get_weather(request):
         return (json.dumps({"status": "error", "message": "WeatherStem API timeout"}), 500, {"Content-Type": "application/json"})
 
     except requests.exceptions.RequestException as e:
-        logging.error(f"WeatherStem API request failed: {e}")
+        logging.error("WeatherStem API request failed: %s", e)
         return (json.dumps({"status": "error", "message": str(e)}), 500, {"Content-Type": "application/json"})
 
     except Exception as e:
-        logging.error(f"Unhandled error in get_weather: {e}")
+        logging.error("Unhandled error in get_weather: %s", e)
         return (json.dumps({"status": "error", "message": str(e)}), 500, {"Content-Type": "application/json"})
\ No newline at end of file